@@ -1,4 +1,3 @@
-import feedparser
 import logging
 import asyncio
 import json
@@ -6,7 +5,17 @@ import os
 import aiohttp
 import uuid
 import re
-from bs4 import BeautifulSoup
+from itertools import chain
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+from aiolimiter import AsyncLimiter
+from lxml import etree
+from lxml import html as lxml_html
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # ====================== 环境配置 =======================
 SAFEW_BOT_TOKEN = os.getenv("SAFEW_BOT_TOKEN")
@@ -15,75 +24,134 @@ RSS_FEED_URL = os.getenv("RSS_FEED_URL")
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SENT_POSTS_FILE = os.path.join(SCRIPT_DIR, "sent_posts.json")
 PENDING_POSTS_FILE = os.path.join(SCRIPT_DIR, "pending_tids.json")
+RSS_STATE_FILE = os.path.join(SCRIPT_DIR, "rss_state.json")
 MAX_PUSH_PER_RUN = 5
+POST_FETCH_CONCURRENCY = 10  # 帖子页面并发抓取数
+MAX_SENT_TIDS = 10000  # 已推送记录最多保留的TID数量
+RSS_CHUNK_SIZE = 64 * 1024  # RSS流式解析的分块大小
+# 只读取这些子节点（完整标签名 → 字段名），避免 atom:link、media:title 等同名命名空间节点覆盖
+RSS_ITEM_FIELDS = {
+    "link": "link",
+    "title": "title",
+    "author": "author",
+    "{http://purl.org/dc/elements/1.1/}creator": "creator",
+}
+RSS_AUTHOR_FIELDS = ("author", "creator")  # 作者字段优先级：<author> → <dc:creator>
 FIXED_PROJECT_URL = "https://tyw44.cc/"
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"
 MAX_IMAGES_PER_MSG = 10  
+# 请求头常量（User-Agent 由 session 统一携带），只读使用
+PAGE_HEADERS = {"Referer": FIXED_PROJECT_URL, "Accept": "text/html,application/xhtml+xml"}
+IMAGE_HEADERS = {"Referer": FIXED_PROJECT_URL}
+IMAGE_PROBE_HEADERS = {**IMAGE_HEADERS, "Range": "bytes=0-15"}
+# 单次请求超时：传入数字时aiohttp只设置total并忽略会话默认值，因此每处都显式给出完整配置
+RSS_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+PAGE_TIMEOUT = aiohttp.ClientTimeout(total=20, connect=10, sock_read=10)
+IMAGE_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=10, sock_read=10)
+API_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+API_TEXT_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=10, sock_read=10)
+API_MAX_RETRIES = 3  # 429限流/5xx时的最大尝试次数
+API_RETRY_STATUSES = frozenset({500, 502, 503, 504})  # 服务端临时错误，按指数退避重试
+API_BACKOFF_BASE = 1  # 退避起始秒数，每次翻倍
+API_BACKOFF_CAP = 30  # 退避上限秒数
+API_RATE_LIMITER = AsyncLimiter(20, 60)  # 所有消息发往同一群组：每分钟最多20次请求
+TID_PATTERN = re.compile(r"thread-(\d+)\.htm")
+# 正文div：class 同时包含 message 与 break-all
+POST_XPATH = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' message ')"
+    " and contains(concat(' ', normalize-space(@class), ' '), ' break-all ')]"
+)
+FIRST_POST_XPATH = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' message ')"
+    " and contains(concat(' ', normalize-space(@class), ' '), ' break-all ')][@isfirst='1']"
+)
+# 统一按UTF-8字节解析，避免页面自带编码声明与str输入冲突
+HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+AUDIT_REJECTED_MARKER = "本帖未审核通过，您无权查看！"
+AUDIT_PENDING_MARKER = "本帖正在审核中"
+AUDIT_PENDING_PATTERN = re.compile(r"本帖正在审核中.*您无权查看", re.DOTALL)
 
 # ====================== 日志配置 =======================
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
-logging.info(f"脚本目录：{SCRIPT_DIR}")
-logging.info(f"已推送文件路径：{SENT_POSTS_FILE}")
-logging.info(f"待审核文件路径：{PENDING_POSTS_FILE}")
+logging.info("脚本目录：%s", SCRIPT_DIR)
+logging.info("已推送文件路径：%s", SENT_POSTS_FILE)
+logging.info("待审核文件路径：%s", PENDING_POSTS_FILE)
+logging.info("RSS缓存文件路径：%s", RSS_STATE_FILE)
 
 # ====================== 工具函数 =======================
+def json_loads(raw):
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def json_dumps(obj):
+    # 返回bytes，格式与 json.dump(..., ensure_ascii=False, indent=2) 一致
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+def write_json_atomic(path, obj):
+    # 一次写入临时文件并fsync后再原子替换，中途崩溃不会留下残缺的记录文件
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "wb") as f:
+        f.write(json_dumps(obj))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+def read_json_file(path, default):
+    # 文件不存在视为空记录，首次写入时由 write_json_atomic 创建
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return default
+    # 空文件或纯空白直接返回默认值；json/orjson 本身可忽略首尾空白，无需 strip 拷贝
+    return json_loads(raw) if raw and not raw.isspace() else default
+
+IMAGE_MIME_MAP = {
+    "jpg": "image/jpeg", "jpeg": "image/jpeg",
+    "png": "image/png", "gif": "image/gif", "webp": "image/webp"
+}
+
 def get_image_content_type(filename):
-    ext = filename.lower().split(".")[-1]
-    mime_map = {
-        "jpg": "image/jpeg", "jpeg": "image/jpeg",
-        "png": "image/png", "gif": "image/gif", "webp": "image/webp"
-    }
-    return mime_map.get(ext, "image/jpeg")
+    ext = os.path.splitext(filename)[1][1:].lower()
+    return IMAGE_MIME_MAP.get(ext, "image/jpeg")
+
+# jpeg / png / gif / webp(RIFF) 文件头
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG", b"GIF8", b"RIFF")
 
 def is_valid_image(data):
     if not data:
         return False
-    signatures = {b"\xff\xd8\xff": "jpeg", b"\x89\x50\x4e\x47": "png", b"\x47\x49\x46\x38": "gif", b"\x52\x49\x46\x46": "webp"}
-    for sig, _ in signatures.items():
-        if data.startswith(sig):
-            return True
-    logging.warning(f"无效图片文件头：{data[:8].hex()}")
+    if data.startswith(IMAGE_SIGNATURES):
+        return True
+    logging.warning("无效图片文件头：%s", data[:8].hex())
     return False
 
 # ====================== TID管理 =======================
 def load_sent_tids():
+    # 返回set，筛选RSS时按哈希判断是否已推送
     try:
-        if not os.path.exists(SENT_POSTS_FILE):
-            with open(SENT_POSTS_FILE, "w", encoding="utf-8") as f:
-                json.dump([], f)
-            logging.info(f"初始化已推送文件：{SENT_POSTS_FILE}")
-            return []
-        with open(SENT_POSTS_FILE, "r", encoding="utf-8") as f:
-            tids = json.loads(f.read().strip() or "[]")
-            return [int(t) for t in tids if isinstance(t, int)]
+        tids = read_json_file(SENT_POSTS_FILE, [])
+        return {int(t) for t in tids if isinstance(t, int)}
     except Exception as e:
-        logging.error(f"读取已推送TID失败：{str(e)}")
-        return []
+        logging.error("读取已推送TID失败：%s", e)
+        return set()
 
 def save_sent_tids(new_tids, existing_tids):
     try:
-        all_tids = sorted(list(set(existing_tids + new_tids)))
-        with open(SENT_POSTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(all_tids, f, ensure_ascii=False, indent=2)
-        logging.info(f"已推送TID更新：新增{len(new_tids)}条，总计{len(all_tids)}条")
+        # 只保留最新的 MAX_SENT_TIDS 条：更早的帖子早已滚出RSS，无需再去重
+        all_tids = sorted(existing_tids | set(new_tids))[-MAX_SENT_TIDS:]
+        write_json_atomic(SENT_POSTS_FILE, all_tids)
+        logging.info("已推送TID更新：新增%d条，总计%d条", len(new_tids), len(all_tids))
     except Exception as e:
-        logging.error(f"保存已推送TID失败：{str(e)}")
+        logging.error("保存已推送TID失败：%s", e)
 
 def load_pending_data():
     try:
-        if not os.path.exists(PENDING_POSTS_FILE):
-            with open(PENDING_POSTS_FILE, "w", encoding="utf-8") as f:
-                json.dump([], f)
-            logging.info(f"初始化待审核文件：{PENDING_POSTS_FILE}")
-            return []
-        if not os.access(PENDING_POSTS_FILE, os.R_OK):
-            raise PermissionError(f"无读取权限：{PENDING_POSTS_FILE}")
-        with open(PENDING_POSTS_FILE, "r", encoding="utf-8") as f:
-            content = f.read().strip() or "[]"
-            data = json.loads(content)
+        data = read_json_file(PENDING_POSTS_FILE, [])
         valid_data = []
         for item in data:
             if isinstance(item, dict) and "tid" in item:
@@ -99,10 +167,10 @@ def load_pending_data():
                     "title": "无标题",
                     "author": "未知用户"
                 })
-        logging.info(f"读取待审核数据：共{len(valid_data)}条 → TID列表：{[d['tid'] for d in valid_data]}")
+        logging.info("读取待审核数据：共%d条 → TID列表：%s", len(valid_data), [d['tid'] for d in valid_data])
         return valid_data
     except Exception as e:
-        logging.error(f"读取待审核数据失败：{str(e)}")
+        logging.error("读取待审核数据失败：%s", e)
         return []
 
 def save_pending_data(data):
@@ -118,138 +186,199 @@ def save_pending_data(data):
                     "title": item.get("title", "无标题").strip(),
                     "author": item.get("author", "未知用户").strip()
                 })
-        temp_file = f"{PENDING_POSTS_FILE}.tmp"
-        with open(temp_file, "w", encoding="utf-8") as f:
-            json.dump(unique_data, f, ensure_ascii=False, indent=2)
-        os.replace(temp_file, PENDING_POSTS_FILE)
-        logging.info(f"待审核数据更新：共{len(unique_data)}条 → TID列表：{[d['tid'] for d in unique_data]}")
+        write_json_atomic(PENDING_POSTS_FILE, unique_data)
+        logging.info("待审核数据更新：共%d条 → TID列表：%s", len(unique_data), [d['tid'] for d in unique_data])
     except Exception as e:
-        logging.error(f"保存待审核数据失败：{str(e)}")
-        try:
-            with open(PENDING_POSTS_FILE, "w", encoding="utf-8") as f:
-                json.dump(unique_data, f, ensure_ascii=False, indent=2)
-            logging.warning("备用方案：待审核数据已写入")
-        except:
-            pass
+        logging.error("保存待审核数据失败：%s", e)
+
+def load_rss_state():
+    # 上次RSS响应的 ETag / Last-Modified，用于条件请求
+    try:
+        state = read_json_file(RSS_STATE_FILE, {})
+        return state if isinstance(state, dict) else {}
+    except Exception as e:
+        logging.error("读取RSS缓存状态失败：%s", e)
+        return {}
+
+def save_rss_state(state):
+    try:
+        write_json_atomic(RSS_STATE_FILE, state)
+        logging.info("RSS缓存状态更新：%s", state)
+    except Exception as e:
+        logging.error("保存RSS缓存状态失败：%s", e)
+
+@dataclass
+class RunState:
+    # 单次运行内共享的推送记录，避免各阶段重复读写文件
+    sent: set
+    pending: list
+    new_sent: set = field(default_factory=set)
+    pending_dirty: bool = False
+
+    def mark_sent(self, tid):
+        self.sent.add(tid)
+        self.new_sent.add(tid)
 
 # ====================== TID提取/RSS获取 ======================
+def build_thread_url(tid):
+    return f"{FIXED_PROJECT_URL}thread-{tid}.htm"
+
 def extract_tid_from_url(url):
     try:
-        match = re.search(r'thread-(\d+)\.htm', url)
+        match = TID_PATTERN.search(url)
         return int(match.group(1)) if match else None
     except Exception as e:
-        logging.error(f"提取TID失败：{str(e)}")
+        logging.error("提取TID失败：%s", e)
         return None
 
-def fetch_updates(sent_tids, pending_tids):
+def parse_rss_item(item):
+    # 只取推送需要的子节点文本（link/title/author/dc:creator），每个字段保留第一个非空值
+    fields = {}
+    for child in item:
+        key = RSS_ITEM_FIELDS.get(child.tag)
+        if key and key not in fields:
+            text = (child.text or "").strip()
+            if text:
+                fields[key] = text
+    # 释放已处理的节点，保持解析内存平稳
+    item.clear()
+    while item.getprevious() is not None:
+        del item.getparent()[0]
+    return fields
+
+async def fetch_updates(session, sent_tids, pending_tids):
     try:
-        logging.info(f"筛选RSS新帖：排除已推送{len(sent_tids)}条 + 待审核{len(pending_tids)}条")
-        feed = feedparser.parse(RSS_FEED_URL)
-        if feed.bozo:
-            logging.error(f"RSS解析失败：{feed.bozo_exception}")
-            return None
-        
+        logging.info("筛选RSS新帖：排除已推送%d条 + 待审核%d条", len(sent_tids), len(pending_tids))
         valid_entries = []
-        for entry in feed.entries:
-            link = entry.get("link", "").strip()
-            if not link:
-                continue
-            tid = extract_tid_from_url(link)
-            if not tid:
-                continue
-            if tid not in sent_tids and tid not in pending_tids:
-                entry["tid"] = tid
-                entry["rss_title"] = entry.get("title", "无标题").strip() 
-                author = entry.get("author") or entry.get("dc_author") or \
-                         entry.get("dc", {}).get("creator") or entry.get("dc_creator") or entry.get("creator")
-                entry["rss_author"] = author.strip() if (author and str(author).strip()) else "未知用户"
-                logging.debug(f"TID={tid} 作者提取：{entry['rss_author']}（来源：author/dc_author等）")
-                valid_entries.append(entry)
+        seen_tids = set()
+        rss_state = await asyncio.to_thread(load_rss_state)
+        headers = {}
+        if rss_state.get("etag"):
+            headers["If-None-Match"] = rss_state["etag"]
+        if rss_state.get("last_modified"):
+            headers["If-Modified-Since"] = rss_state["last_modified"]
+        # 边下载边增量解析<item>，不构建完整的feed对象
+        parser = etree.XMLPullParser(events=("end",), tag="{*}item")
+        async with session.get(RSS_FEED_URL, headers=headers, timeout=RSS_TIMEOUT) as resp:
+            if resp.status == 304:
+                logging.info("RSS未更新（304），无全新帖子")
+                return []
+            if resp.status != 200:
+                logging.error("RSS请求失败（状态码：%s）", resp.status)
+                return None
+            new_state = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified")
+            }
+            async for chunk in resp.content.iter_chunked(RSS_CHUNK_SIZE):
+                parser.feed(chunk)
+                for _, item in parser.read_events():
+                    fields = parse_rss_item(item)
+                    link = fields.get("link", "")
+                    if not link:
+                        continue
+                    tid = extract_tid_from_url(link)
+                    if not tid:
+                        continue
+                    # 同一帖子在RSS中出现多次时只处理一次，避免重复抓取和重复推送
+                    if tid in seen_tids:
+                        continue
+                    seen_tids.add(tid)
+                    if tid not in sent_tids and tid not in pending_tids:
+                        author = next((fields[k] for k in RSS_AUTHOR_FIELDS if fields.get(k)), "未知用户")
+                        valid_entries.append({
+                            "tid": tid,
+                            "link": link,
+                            "rss_title": fields.get("title", "无标题"),
+                            "rss_author": author
+                        })
+                        logging.debug("TID=%s 作者提取：%s（来源：author/dc:creator）", tid, author)
+        parser.close()
+
+        # 仅当该版本RSS已无待处理帖子时才记录缓存标识，
+        # 否则304会掩盖本轮未推送完（超出单次上限/推送失败）的帖子
+        if not valid_entries and any(new_state.values()) and new_state != rss_state:
+            await asyncio.to_thread(save_rss_state, new_state)
         
-        logging.info(f"RSS筛选完成：共{len(valid_entries)}条全新待推送帖")
+        logging.info("RSS筛选完成：共%d条全新待推送帖", len(valid_entries))
         return sorted(valid_entries, key=lambda x: x["tid"])
+    except etree.XMLSyntaxError as e:
+        logging.error("RSS解析失败：%s", e)
+        return None
     except Exception as e:
-        logging.error(f"获取RSS异常：{str(e)}")
+        logging.error("获取RSS异常：%s", e)
         return None
 
 # ====================== 帖子信息获取 =======================
 async def get_post_status(session, webpage_url, tid):
     status_code = 200
     try:
-        headers = {
-            "User-Agent": USER_AGENT,
-            "Referer": FIXED_PROJECT_URL,
-            "Accept": "text/html,application/xhtml+xml"
-        }
-        async with session.get(webpage_url, headers=headers, timeout=20) as resp:
+        async with session.get(webpage_url, headers=PAGE_HEADERS, timeout=PAGE_TIMEOUT) as resp:
             status_code = resp.status
             if resp.status != 200:
-                logging.warning(f"TID={tid} 帖子请求失败（状态码：{resp.status}）")
+                logging.warning("TID=%s 帖子请求失败（状态码：%s）", tid, resp.status)
                 return [], False, status_code, False
             html = await resp.text()
 
-        soup = BeautifulSoup(html, "html.parser")
-        is_pending = False
-        is_rejected = False
-
-        # 检测未审核通过状态
-        audit_pattern_rejected = re.compile(r"本帖未审核通过，您无权查看！", re.DOTALL | re.UNICODE)
-        if audit_pattern_rejected.search(html):
-            is_rejected = True
-            logging.info(f"TID={tid} 确认未审核通过状态")
-            return [], False, status_code, is_rejected
-
-        # 检测待审核状态
-        audit_h4_tags = soup.find_all("h4", class_=re.compile(r"card-title"))
-        audit_pattern_pending = re.compile(r"本帖正在审核中.*您无权查看", re.DOTALL | re.UNICODE)
-        for h4_tag in audit_h4_tags:
-            if audit_pattern_pending.search(h4_tag.get_text(strip=True)):
-                is_pending = True
-                break
-        if not is_pending and audit_pattern_pending.search(html):
-            is_pending = True
-
-        if is_pending:
-            logging.info(f"TID={tid} 确认待审核状态")
+        # 审核状态只需子串匹配，命中时无需解析HTML
+        if AUDIT_REJECTED_MARKER in html:
+            logging.info("TID=%s 确认未审核通过状态", tid)
+            return [], False, status_code, True
+
+        if AUDIT_PENDING_MARKER in html and AUDIT_PENDING_PATTERN.search(html):
+            logging.info("TID=%s 确认待审核状态", tid)
             return [], True, status_code, False
 
-        target_divs = soup.find_all("div", class_="message break-all", isfirst="1") or soup.find_all("div", class_="message break-all")
+        tree = lxml_html.document_fromstring(html.encode("utf-8"), parser=HTML_PARSER)
+        # 优先取首楼正文，没有时退回全部正文div
+        target_divs = FIRST_POST_XPATH(tree) or POST_XPATH(tree)
         if not target_divs:
-            logging.warning(f"TID={tid} 未找到正文div，无图片")
+            logging.warning("TID=%s 未找到正文div，无图片", tid)
             return [], False, status_code, False
 
         images = []
-        base_domain = "/".join(webpage_url.split("/")[:3])
-        for div in target_divs:
-            for img in div.find_all("img"):
-                img_url = img.get("data-src", "").strip() or img.get("src", "").strip()
-                if not img_url or img_url.startswith(("data:image/", "javascript:")):
-                    continue
-                if img_url.startswith("/"):
-                    img_url = f"{base_domain}{img_url}"
-                elif not img_url.startswith(("http", "https")):
-                    img_url = f"{base_domain}/{img_url}"
-                if img_url not in images and img_url.startswith(("http", "https")):
-                    images.append(img_url)
-
-        final_images = images[:MAX_IMAGES_PER_MSG]
-        logging.info(f"TID={tid} 图片提取完成：共{len(images)}张，保留前{len(final_images)}张")
-        return final_images, False, status_code, False
+        seen_images = set()
+        for img in chain.from_iterable(div.iter("img") for div in target_divs):
+            img_url = (img.get("data-src") or "").strip() or (img.get("src") or "").strip()
+            if not img_url or img_url.startswith(("data:image/", "javascript:")):
+                continue
+            # 统一处理绝对路径、相对路径及 //cdn 形式的协议相对地址
+            img_url = urljoin(webpage_url, img_url)
+            if img_url not in seen_images and img_url.startswith(("http://", "https://")):
+                seen_images.add(img_url)
+                images.append(img_url)
+                # 单条消息最多发送 MAX_IMAGES_PER_MSG 张，够数即停止
+                if len(images) >= MAX_IMAGES_PER_MSG:
+                    break
+
+        logging.info("TID=%s 图片提取完成：保留%d张（上限%s张）", tid, len(images), MAX_IMAGES_PER_MSG)
+        return images, False, status_code, False
     except Exception as e:
-        logging.error(f"TID={tid} 帖子信息获取异常：{str(e)}")
+        logging.error("TID=%s 帖子信息获取异常：%s", tid, e)
         # 异常时返回特殊状态码-1，表示获取失败
         return [], False, -1, False
 
+async def fetch_post_statuses(session, posts):
+    # posts 为 (链接, TID) 列表；并发抓取各帖状态，结果顺序与输入一致
+    semaphore = asyncio.Semaphore(POST_FETCH_CONCURRENCY)
+
+    async def fetch_one(link, tid):
+        async with semaphore:
+            return await get_post_status(session, link, tid)
+
+    return await asyncio.gather(*(fetch_one(link, tid) for link, tid in posts))
+
 # ====================== Markdown转义/消息构造 =======================
+# 发送均使用 parse_mode=Markdown（旧版），仅 _ * ` [ 为实体字符需转义；
+# 其他字符加反斜杠会被原样显示。"[" 未转义会被当作链接起始导致消息被拒
+MARKDOWN_ESCAPE_TABLE = str.maketrans({c: "\\" + c for c in "_*`["})
+
 def escape_markdown(text):
-    special_chars = r"_*~`>#+!()"
-    for char in special_chars:
-        if char in text:
-            text = text.replace(char, f"\{char}")
-    return text
+    return text.translate(MARKDOWN_ESCAPE_TABLE)
 
-def build_caption(title, author, link):
-    footer = """
+assert escape_markdown("a*b_c") == "a\\*b\\_c"
+
+CAPTION_FOOTER = """
 ✅论坛最新地址: 
 tyw44.cc  tyw30.cc tyw33.cc
 ✅点击加入交流群: https://www.sfw.vc/tyw666
@@ -257,68 +386,112 @@ tyw44.cc  tyw30.cc tyw33.cc
 沈复： @tywcc
 沐泽： @ssss001
 怡怡： @yiyi3
-    """.strip()
-    return (
-        f"{escape_markdown(title)}\n"
-        f"由 ＠{escape_markdown(author)} 发起的话题讨论\n"
-        f"链接：{link}\n\n"
-        f"{footer}"
-    )
+""".strip()
+
+def build_caption(title, author, link):
+    return "\n".join((
+        escape_markdown(title),
+        f"由 ＠{escape_markdown(author)} 发起的话题讨论",
+        f"链接：{link}",
+        "",
+        CAPTION_FOOTER
+    ))
 
 # ====================== 消息发送函数 ========================
-async def send_single_photo(session, image_url, caption, tid, delay=5):
-    try:
-        await asyncio.sleep(delay)
-        api_url = f"https://api.safew.org/bot{SAFEW_BOT_TOKEN}/sendPhoto"
-        async with session.get(image_url, headers={"User-Agent": USER_AGENT}, timeout=15) as resp:
+async def fetch_image(session, image_url):
+    # 先用Range请求只取文件头校验，无效图片不再下载完整内容
+    async with session.get(image_url, headers=IMAGE_PROBE_HEADERS, timeout=IMAGE_TIMEOUT) as resp:
+        if resp.status == 200:
+            # 服务器忽略Range，已返回完整图片，直接使用
             img_data = await resp.read()
             if not is_valid_image(img_data):
-                return False
-            content_type = resp.headers.get("Content-Type") or get_image_content_type(image_url)
-        boundary = f"----WebKitFormBoundary{uuid.uuid4().hex[:16]}"
-        filename = f"single_{tid}_{uuid.uuid4().hex[:8]}.jpg"
-        body = b"\r\n".join([
-            f"--{boundary}".encode("utf-8"),
-            b'Content-Disposition: form-data; name="chat_id"',
-            b'',
-            str(SAFEW_CHAT_ID).encode("utf-8"),
-            f"--{boundary}".encode("utf-8"),
-            b'Content-Disposition: form-data; name="caption"',
-            b'',
-            caption.encode("utf-8"),
-            f"--{boundary}".encode("utf-8"),
-            f'Content-Disposition: form-data; name="photo"; filename="{filename}"'.encode("utf-8"),
-            f"Content-Type: {content_type}".encode("utf-8"),
-            b'',
-            img_data,
-            f"--{boundary}--".encode("utf-8")
-        ])
-        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
-        async with session.post(api_url, data=body, headers=headers, timeout=30) as resp:
-            if resp.status == 200:
-                logging.info(f"TID={tid} ✅ 单图消息发送成功")
-                return True
-            logging.error(f"TID={tid} ❌ 单图失败：{await resp.text()[:200]}")
+                return None
+            return img_data, resp.headers.get("Content-Type") or get_image_content_type(image_url)
+        # 206 响应体只有请求的16字节，完整读取，避免 content.read 返回不足16字节
+        if resp.status != 206 or not is_valid_image(await resp.read()):
+            return None
+    async with session.get(image_url, headers=IMAGE_HEADERS, timeout=IMAGE_TIMEOUT) as resp:
+        if resp.status != 200:
+            return None
+        img_data = await resp.read()
+        if not is_valid_image(img_data):
+            return None
+        return img_data, resp.headers.get("Content-Type") or get_image_content_type(image_url)
+
+def parse_retry_after(text, default=5):
+    try:
+        return int(json.loads(text).get("parameters", {}).get("retry_after", default))
+    except Exception:
+        return default
+
+async def post_to_api(session, method, build_request, tid, label, timeout=API_TIMEOUT):
+    # build_request 每次调用都返回新的请求参数（FormData 不能重复发送）
+    api_url = f"https://api.safew.org/bot{SAFEW_BOT_TOKEN}/{method}"
+    for attempt in range(1, API_MAX_RETRIES + 1):
+        async with API_RATE_LIMITER:
+            async with session.post(api_url, timeout=timeout, **build_request()) as resp:
+                if resp.status == 200:
+                    return True
+                status = resp.status
+                text = await resp.text()
+        if status == 429 and attempt < API_MAX_RETRIES:
+            retry_after = parse_retry_after(text)
+            logging.warning("TID=%s %s触发限流（429），%s秒后第%s次尝试", tid, label, retry_after, attempt + 1)
+            await asyncio.sleep(retry_after)
+            continue
+        if status in API_RETRY_STATUSES and attempt < API_MAX_RETRIES:
+            delay = min(API_BACKOFF_BASE * 2 ** (attempt - 1), API_BACKOFF_CAP)
+            logging.warning("TID=%s %s服务端错误（%s），%s秒后第%s次尝试", tid, label, status, delay, attempt + 1)
+            await asyncio.sleep(delay)
+            continue
+        logging.error("TID=%s ❌ %s失败：%.200s", tid, label, text)
+        return False
+    return False
+
+async def send_single_photo(session, image_url, caption, tid):
+    try:
+        image = await fetch_image(session, image_url)
+        if not image:
             return False
+        img_data, content_type = image
+        filename = f"single_{tid}_{uuid.uuid4().hex[:8]}.jpg"
+
+        def build_form():
+            form = aiohttp.FormData()
+            form.add_field("chat_id", str(SAFEW_CHAT_ID))
+            form.add_field("caption", caption)
+            form.add_field("parse_mode", "Markdown")
+            form.add_field("photo", img_data, filename=filename, content_type=content_type)
+            return {"data": form}
+
+        if await post_to_api(session, "sendPhoto", build_form, tid, "单图"):
+            logging.info("TID=%s ✅ 单图消息发送成功", tid)
+            return True
+        return False
     except Exception as e:
-        logging.error(f"TID={tid} 单图发送异常：{str(e)}")
+        logging.error("TID=%s 单图发送异常：%s", tid, e)
         return False
 
-async def send_media_group(session, image_urls, caption, tid, delay=5):
+async def send_media_group(session, image_urls, caption, tid):
     if len(image_urls) < 2 or len(image_urls) > MAX_IMAGES_PER_MSG:
         return False
     try:
-        await asyncio.sleep(delay)
-        api_url = f"https://api.safew.org/bot{SAFEW_BOT_TOKEN}/sendMediaGroup"
+        # 并发下载全部图片，任一失败则放弃多图发送
+        images = await asyncio.gather(
+            *(fetch_image(session, img_url) for img_url in image_urls),
+            return_exceptions=True
+        )
         media_data = []
-        for idx, img_url in enumerate(image_urls, 1):
-            filename = f"media_{tid}_{idx}_{uuid.uuid4().hex[:8]}.jpg"
-            async with session.get(img_url, headers={"User-Agent": USER_AGENT}, timeout=15) as resp:
-                img_data = await resp.read()
-                if not is_valid_image(img_data):
-                    return False
-                content_type = resp.headers.get("Content-Type") or get_image_content_type(img_url)
-            media_data.append((img_data, content_type, filename))
+        # 文件名只需在单次请求内唯一，共用一个随机后缀
+        req_id = uuid.uuid4().hex[:8]
+        for idx, image in enumerate(images, 1):
+            if isinstance(image, Exception):
+                logging.warning("TID=%s 第%s张图片下载异常：%s", tid, idx, image)
+                return False
+            if not image:
+                return False
+            img_data, content_type = image
+            media_data.append((img_data, content_type, f"media_{tid}_{idx}_{req_id}.jpg"))
         
         media_array = []
         for idx, (_, ct, fn) in enumerate(media_data):
@@ -326,223 +499,227 @@ async def send_media_group(session, image_urls, caption, tid, delay=5):
             if idx == 0:
                 item["caption"] = caption
             media_array.append(item)
-        
-        boundary = f"----WebKitFormBoundary{uuid.uuid4().hex[:16]}"
-        body_parts = [
-            f"--{boundary}".encode("utf-8"),
-            b'Content-Disposition: form-data; name="chat_id"',
-            b'',
-            str(SAFEW_CHAT_ID).encode("utf-8"),
-            f"--{boundary}".encode("utf-8"),
-            b'Content-Disposition: form-data; name="media"',
-            b'Content-Type: application/json',
-            b'',
-            json.dumps(media_array, ensure_ascii=False).encode("utf-8")
-        ]
-        for img_data, ct, fn in media_data:
-            body_parts.extend([
-                f"--{boundary}".encode("utf-8"),
-                f'Content-Disposition: form-data; name="{fn}"; filename="{fn}"'.encode("utf-8"),
-                f"Content-Type: {ct}".encode("utf-8"),
-                b'',
-                img_data
-            ])
-        body_parts.append(f"--{boundary}--".encode("utf-8"))
-        body = b"\r\n".join(body_parts)
-        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
-        async with session.post(api_url, data=body, headers=headers, timeout=30) as resp:
-            if resp.status == 200:
-                logging.info(f"TID={tid} ✅ 多图消息发送成功")
-                return True
-            logging.error(f"TID={tid} ❌ 多图失败：{await resp.text()[:200]}")
-            return False
+        media_json = json.dumps(media_array, ensure_ascii=False)
+
+        def build_form():
+            form = aiohttp.FormData()
+            form.add_field("chat_id", str(SAFEW_CHAT_ID))
+            form.add_field("media", media_json, content_type="application/json")
+            for img_data, ct, fn in media_data:
+                form.add_field(fn, img_data, filename=fn, content_type=ct)
+            return {"data": form}
+
+        if await post_to_api(session, "sendMediaGroup", build_form, tid, "多图"):
+            logging.info("TID=%s ✅ 多图消息发送成功", tid)
+            return True
+        return False
     except Exception as e:
-        logging.error(f"TID={tid} 多图发送异常：{str(e)}")
+        logging.error("TID=%s 多图发送异常：%s", tid, e)
         return False
 
-async def send_text_msg(session, caption, tid, delay=5):
+async def send_text_msg(session, caption, tid):
     try:
-        await asyncio.sleep(delay)
-        api_url = f"https://api.safew.org/bot{SAFEW_BOT_TOKEN}/sendMessage"
         payload = {
             "chat_id": SAFEW_CHAT_ID,
             "text": caption,
             "parse_mode": "Markdown",
             "disable_web_page_preview": True
         }
-        async with session.post(api_url, json=payload, timeout=15) as resp:
-            if resp.status == 200:
-                logging.info(f"TID={tid} ✅ 纯文本发送成功")
-                return True
-            logging.error(f"TID={tid} ❌ 文本失败：{await resp.text()[:200]}")
-            return False
+        if await post_to_api(session, "sendMessage", lambda: {"json": payload}, tid, "文本", timeout=API_TEXT_TIMEOUT):
+            logging.info("TID=%s ✅ 纯文本发送成功", tid)
+            return True
+        return False
     except Exception as e:
-        logging.error(f"TID={tid} 文本发送异常：{str(e)}")
+        logging.error("TID=%s 文本发送异常：%s", tid, e)
         return False
 
+async def send_post(session, images, caption, tid):
+    # 按图片数量选择单图/多图/纯文本发送
+    if len(images) == 1:
+        return await send_single_photo(session, images[0], caption, tid)
+    if 2 <= len(images) <= MAX_IMAGES_PER_MSG:
+        return await send_media_group(session, images, caption, tid)
+    return await send_text_msg(session, caption, tid)
+
 # ====================== 待审核数据检查 =======================
-async def check_pending_data(session):
-    pending_data = load_pending_data()
+async def process_pending_item(session, item, post_status):
+    # 返回处理结果："passed"（已推送/未通过审核）/"pending"（保留）/"deleted"
+    tid = item["tid"]
+    link = build_thread_url(tid)
+    images, is_pending, status_code, is_rejected = post_status
+
+    # 处理获取异常的情况（status_code == -1）
+    if status_code == -1:
+        logging.warning("TID=%s 获取状态异常，保留待审核", tid)
+        return "pending"
+
+    if status_code == 404:
+        logging.warning("TID=%s 帖子已删除（404），从待审核移除", tid)
+        return "deleted"
+
+    if status_code != 200:
+        logging.warning("TID=%s 请求异常（%s），保留待审核", tid, status_code)
+        return "pending"
+
+    if is_rejected:
+        # 未审核通过：移出待审核，加入已推送，但不发送消息
+        logging.info("TID=%s 未审核通过，移出待审核并标记为已推送（不发送消息）", tid)
+        return "passed"
+
+    if is_pending:
+        logging.info("TID=%s 仍待审核，保留", tid)
+        return "pending"
+
+    caption = build_caption(
+        title=item["title"],
+        author=item["author"],
+        link=link
+    )
+
+    if await send_post(session, images, caption, tid):
+        logging.info("TID=%s 审核通过推送成功（标题：%.20s...）", tid, item['title'])
+        return "passed"
+    logging.warning("TID=%s 推送失败，保留待重试", tid)
+    return "pending"
+
+async def check_pending_data(session, state):
+    pending_data = state.pending
     if not pending_data:
         logging.info("无待审核数据，跳过检查")
         return
 
-    logging.info(f"\n=== 开始检查待审核数据（共{len(pending_data)}条 → {[d['tid'] for d in pending_data]}）===")
-    sent_tids = load_sent_tids()
-    passed_tids = []
-    still_pending = []
-    deleted_tids = []
-
+    logging.info("\n=== 开始检查待审核数据（共%d条 → %s）===", len(pending_data), [d['tid'] for d in pending_data])
     for item in pending_data:
-        tid = item["tid"]
-        link = f"{FIXED_PROJECT_URL}thread-{tid}.htm"
-        logging.info(f"检查TID={tid} 审核状态：{link[:50]}...")
-        
-        images, is_pending, status_code, is_rejected = await get_post_status(session, link, tid)
-
-        # 处理获取异常的情况（status_code == -1）
-        if status_code == -1:
-            still_pending.append(item)
-            logging.warning(f"TID={tid} 获取状态异常，保留待审核")
-            continue
-
-        if status_code == 404:
-            deleted_tids.append(tid)
-            logging.warning(f"TID={tid} 帖子已删除（404），从待审核移除")
-            continue
-
-        if status_code != 200:
-            still_pending.append(item)
-            logging.warning(f"TID={tid} 请求异常（{status_code}），保留待审核")
-            continue
-
-        if is_rejected:
-            # 未审核通过：移出待审核，加入已推送，但不发送消息
-            passed_tids.append(tid)
-            sent_tids.append(tid)
-            logging.info(f"TID={tid} 未审核通过，移出待审核并标记为已推送（不发送消息）")
-            continue
+        logging.info("检查TID=%s 审核状态：%.50s...", item["tid"], build_thread_url(item["tid"]))
+    post_statuses = await fetch_post_statuses(
+        session, [(build_thread_url(item["tid"]), item["tid"]) for item in pending_data]
+    )
+    # 页面并发抓取完成后按TID顺序逐条处理/发送，保持推送顺序
+    results = []
+    for item, post_status in zip(pending_data, post_statuses):
+        results.append(await process_pending_item(session, item, post_status))
+
+    passed_tids = [item["tid"] for item, result in zip(pending_data, results) if result == "passed"]
+    still_pending = [item for item, result in zip(pending_data, results) if result == "pending"]
+    deleted_count = results.count("deleted")
+
+    if len(still_pending) != len(pending_data):
+        state.pending = still_pending
+        state.pending_dirty = True
+    for tid in passed_tids:
+        state.mark_sent(tid)
+    logging.info("待审核检查完成：%d条通过，%d条待审，%d条删除", len(passed_tids), len(still_pending), deleted_count)
 
-        if is_pending:
-            still_pending.append(item)
-            logging.info(f"TID={tid} 仍待审核，保留")
-            continue
+# ====================== 全新帖子推送 =======================
+async def process_new_entry(session, entry, post_status):
+    # 返回处理结果："sent"/"rejected"/"pending"/"skipped"/"failed"
+    tid = entry["tid"]
+    link = entry["link"]
+    rss_title = entry["rss_title"]
+    rss_author = entry["rss_author"]
+    logging.debug("TID=%s RSS信息：标题=%.20s，作者=%s", tid, rss_title, rss_author)
+    images, is_pending, status_code, is_rejected = post_status
+
+    # 处理获取异常的情况（status_code == -1）
+    if status_code == -1:
+        logging.warning("TID=%s 获取状态异常，跳过推送", tid)
+        return "skipped"
+
+    if status_code == 404:
+        logging.warning("TID=%s 帖子已删除（404），跳过", tid)
+        return "skipped"
+
+    if status_code != 200:
+        logging.warning("TID=%s 请求异常（%s），跳过", tid, status_code)
+        return "skipped"
+
+    if is_rejected:
+        # 未审核通过：直接加入已推送（不发送消息）
+        logging.info("TID=%s 未审核通过，标记为已推送（不发送消息）", tid)
+        return "rejected"
+
+    if is_pending:
+        logging.info("TID=%s 新增待审核（标题：%.20s... 作者：%s）", tid, rss_title, rss_author)
+        return "pending"
+
+    caption = build_caption(
+        title=rss_title,
+        author=rss_author,
+        link=link
+    )
 
-        caption = build_caption(
-            title=item["title"],
-            author=item["author"],
-            link=link
-        )
-        
-        success = False
-        if len(images) == 1:
-            success = await send_single_photo(session, images[0], caption, tid, delay=3)
-        elif 2 <= len(images) <= MAX_IMAGES_PER_MSG:
-            success = await send_media_group(session, images, caption, tid, delay=3)
-        else:
-            success = await send_text_msg(session, caption, tid, delay=3)
-
-        if success:
-            passed_tids.append(tid)
-            sent_tids.append(tid)
-            logging.info(f"TID={tid} 审核通过推送成功（标题：{item['title'][:20]}...）")
-        else:
-            still_pending.append(item)
-            logging.warning(f"TID={tid} 推送失败，保留待重试")
-
-    save_pending_data(still_pending)
-    if passed_tids:
-        save_sent_tids(passed_tids, sent_tids)
-    logging.info(f"待审核检查完成：{len(passed_tids)}条通过，{len(still_pending)}条待审，{len(deleted_tids)}条删除")
+    if await send_post(session, images, caption, tid):
+        logging.info("TID=%s 全新帖子推送成功（作者：%s）", tid, rss_author)
+        return "sent"
+    return "failed"
 
-# ====================== 全新帖子推送 =======================
-async def push_new_posts(session, new_entries):
+async def push_new_posts(session, state, new_entries):
     if not new_entries:
         logging.info("无全新帖子待推送")
         return
 
-    logging.info(f"\n=== 开始推送全新帖子（共{len(new_entries)}条）===")
-    sent_tids = load_sent_tids()
-    pending_data = load_pending_data()
+    logging.info("\n=== 开始推送全新帖子（共%d条）===", len(new_entries))
     success_pushed = []
 
-    for i, entry in enumerate(new_entries):
-        tid = entry["tid"]
-        link = entry["link"]
-        delay = 5 if i > 0 else 0
-
-        rss_title = entry["rss_title"]
-        rss_author = entry["rss_author"]
-        logging.debug(f"TID={tid} RSS信息：标题={rss_title[:20]}，作者={rss_author}")
-
-        images, is_pending, status_code, is_rejected = await get_post_status(session, link, tid)
-        
-        # 处理获取异常的情况（status_code == -1）
-        if status_code == -1:
-            logging.warning(f"TID={tid} 获取状态异常，跳过推送")
-            continue
-        
-        if status_code == 404:
-            logging.warning(f"TID={tid} 帖子已删除（404），跳过")
-            continue
-        
-        if status_code != 200:
-            logging.warning(f"TID={tid} 请求异常（{status_code}），跳过")
-            continue
-
-        if is_rejected:
-            # 未审核通过：直接加入已推送（不发送消息）
-            success_pushed.append(tid)
-            sent_tids.append(tid)
-            logging.info(f"TID={tid} 未审核通过，标记为已推送（不发送消息）")
-            continue
+    post_statuses = await fetch_post_statuses(
+        session, [(entry["link"], entry["tid"]) for entry in new_entries]
+    )
 
-        if is_pending:
-            pending_data.append({
-                "tid": tid,
-                "title": rss_title,
-                "author": rss_author
+    # 页面并发抓取完成后按TID顺序逐条处理/发送，保持推送顺序
+    for entry, post_status in zip(new_entries, post_statuses):
+        result = await process_new_entry(session, entry, post_status)
+        if result in ("sent", "rejected"):
+            success_pushed.append(entry["tid"])
+            state.mark_sent(entry["tid"])
+        elif result == "pending":
+            state.pending.append({
+                "tid": entry["tid"],
+                "title": entry["rss_title"],
+                "author": entry["rss_author"]
             })
-            logging.info(f"TID={tid} 新增待审核（标题：{rss_title[:20]}... 作者：{rss_author}）")
-            continue
+            state.pending_dirty = True
 
-        caption = build_caption(
-            title=rss_title,
-            author=rss_author,
-            link=link
-        )
-        
-        success = False
-        if len(images) == 1:
-            success = await send_single_photo(session, images[0], caption, tid, delay)
-        elif 2 <= len(images) <= MAX_IMAGES_PER_MSG:
-            success = await send_media_group(session, images, caption, tid, delay)
-        else:
-            success = await send_text_msg(session, caption, tid, delay)
-
-        if success:
-            success_pushed.append(tid)
-            sent_tids.append(tid)
-            logging.info(f"TID={tid} 全新帖子推送成功（作者：{rss_author}）")
-
-    # 保存待审核数据（如有新增）
-    if any(entry["tid"] in [d["tid"] for d in pending_data] for entry in new_entries):
-        save_pending_data(pending_data)
-    
-    if success_pushed:
-        save_sent_tids(success_pushed, sent_tids)
-    else:
+    if not success_pushed:
         logging.info("无全新帖子推送成功")
 
 # ====================== 主逻辑 =======================
+def create_session():
+    # 整个运行共用一个连接池：同域名的图片/接口请求复用keep-alive连接
+    connector = aiohttp.TCPConnector(
+        limit=32,
+        limit_per_host=16,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+        enable_cleanup_closed=True
+    )
+    # 会话默认超时仅作兜底，各请求均传入自己的 ClientTimeout
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={"User-Agent": USER_AGENT},
+        timeout=aiohttp.ClientTimeout(total=60, connect=10, sock_read=20)
+    )
+
+def flush_run_state(state):
+    if state.new_sent:
+        save_sent_tids(state.new_sent, state.sent)
+    if state.pending_dirty:
+        save_pending_data(state.pending)
+
 async def check_for_updates():
-    async with aiohttp.ClientSession() as session:
-        await check_pending_data(session)
-        sent_tids = load_sent_tids()
-        pending_tids = [d["tid"] for d in load_pending_data()]
-        new_entries = fetch_updates(sent_tids, pending_tids)
-        if new_entries:
-            await push_new_posts(session, new_entries[:MAX_PUSH_PER_RUN])
+    # 每次运行只读一次记录文件，结束时（含异常）统一写回
+    state = RunState(
+        sent=await asyncio.to_thread(load_sent_tids),
+        pending=await asyncio.to_thread(load_pending_data)
+    )
+    try:
+        async with create_session() as session:
+            await check_pending_data(session, state)
+            pending_tids = {d["tid"] for d in state.pending}
+            new_entries = await fetch_updates(session, state.sent, pending_tids)
+            if new_entries:
+                await push_new_posts(session, state, new_entries[:MAX_PUSH_PER_RUN])
+    finally:
+        await asyncio.to_thread(flush_run_state, state)
 
 async def main():
     logging.info("===== SafeW RSS推送脚本启动 =====")
@@ -550,14 +727,10 @@ async def main():
         logging.error("❌ 缺少环境变量，终止")
         return
 
-    if not os.path.exists(PENDING_POSTS_FILE):
-        save_pending_data([])
-        logging.info(f"初始化待审核文件：{PENDING_POSTS_FILE}")
-
     try:
         await check_for_updates()
     except Exception as e:
-        logging.error(f"❌ 核心逻辑异常：{str(e)}")
+        logging.error("❌ 核心逻辑异常：%s", e)
     logging.info("===== 脚本运行结束 =====")
 
 if __name__ == "__main__":